@@ -1,308 +1,743 @@
 # app.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
+import os
+import re
+import hmac
+import hashlib
+import time
+import logging
+import threading
 import bcrypt
-from datetime import datetime
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter is optional: exports fall back to openpyxl's write-only workbook
+    xlsxwriter = None
+try:
+    from numba import njit
+except ImportError:  # numba is optional: without it the FIFO kernel runs as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+try:
+    from pyexcelerate import Workbook as FastWorkbook, Style, Format
+except ImportError:  # pyexcelerate is optional: the report falls back to the xlsxwriter writer
+    FastWorkbook = None
+from datetime import date, datetime
 from io import BytesIO
-from collections import deque
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 
 st.set_page_config(page_title="Creditors 43B(h) Tool", layout="wide")
 
+logger = logging.getLogger(__name__)
+
 # -------------------------
 # Authentication (reuse your method: st.secrets or users.json)
 # -------------------------
 def load_users_from_file(fname="users.json"):
     try:
         with open(fname, "r") as f:
-            return json.load(f)
+            return normalize_users({"users": json.load(f)})
     except FileNotFoundError:
         return {}
 
+def _parse_expiry(username, raw):
+    # "YYYY-MM-DD" -> date, parsed once at load rather than on every login
+    if not raw:
+        return None
+    try:
+        return date.fromisoformat(str(raw))
+    except ValueError:
+        pass
+    try:
+        # strptime also takes unpadded dates such as "2099-1-5"
+        return datetime.strptime(str(raw), "%Y-%m-%d").date()
+    except ValueError:
+        # fail closed: an unreadable expiry must not become "never expires"
+        logger.warning("unreadable expiry %r for user %r; treating the account as expired", raw, username)
+        return date.min
+
+def _parse_cost(username, raw):
+    # optional per-user bcrypt cost (e.g. 4 for local test accounts); bcrypt accepts 4..31
+    if raw in (None, ""):
+        return None
+    try:
+        cost = int(raw)
+    except (TypeError, ValueError):
+        cost = -1
+    if not 4 <= cost <= 31:
+        logger.warning("invalid bcrypt cost %r for user %r; using the default", raw, username)
+        return None
+    return cost
+
+def _user_record(username, password, expiry, cost=None):
+    # passwords are kept encoded, with the bcrypt/plaintext decision made here once
+    is_bcrypt = isinstance(password, str) and password.startswith("$2")
+    cost = _parse_cost(username, cost)
+    if is_bcrypt and cost is None:
+        stored_cost = _bcrypt_cost(password)
+        if stored_cost is not None and stored_cost < BCRYPT_MIN_ROUNDS:
+            logger.warning("bcrypt hash for user %r uses cost %d (< %d); re-hash it with hash_password()",
+                           username, stored_cost, BCRYPT_MIN_ROUNDS)
+    return {
+        "password": str(password).encode() if password else None,
+        "is_bcrypt": is_bcrypt,
+        "expiry": _parse_expiry(username, expiry),
+        "cost": cost,
+    }
+
 def normalize_users(st_secrets):
     users_out = {}
     raw = st_secrets.get("users", {}) if st_secrets else {}
     for k, v in raw.items():
         if isinstance(v, dict):
-            users_out[k] = {"password": v.get("password"), "expiry": v.get("expiry")}
+            users_out[k] = _user_record(k, v.get("password"), v.get("expiry"), v.get("cost"))
         else:
-            users_out[k] = {"password": v, "expiry": None}
+            users_out[k] = _user_record(k, v, None)
     return users_out
 
-def check_login(username: str, password: str, users_dict: dict):
+def save_user_password(fname, username, password_hash):
+    """write a (re-)hashed password back into users.json, keeping the rest of the entry"""
+    with open(fname, "r") as f:
+        raw = json.load(f)
+    entry = raw.get(username)
+    if isinstance(entry, dict):
+        entry["password"] = password_hash
+    else:
+        raw[username] = password_hash
+    tmp = f"{fname}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(raw, f, indent=2)
+    os.replace(tmp, fname)
+
+# bcrypt cost: new hashes use BCRYPT_DEFAULT_ROUNDS, or more if this host hashes fast enough
+# to fit a higher cost in ~250 ms. Each +1 doubles the work (2^cost key expansions): roughly
+# 75 ms at 10 and 600 ms at 13 on typical hardware. Stored hashes below BCRYPT_MIN_ROUNDS are
+# flagged at load, and any below BCRYPT_DEFAULT_ROUNDS are raised to it on login (never lowered,
+# and never to the calibrated cost, which varies by host and from one benchmark run to the
+# next). A per-user "cost" (e.g. 4) overrides this and is only meant for local test accounts.
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_DEFAULT_ROUNDS = 12
+BCRYPT_MAX_ROUNDS = 14
+BCRYPT_TARGET_SECONDS = 0.25
+
+@st.cache_resource(show_spinner=False)
+def calibrate_bcrypt_rounds(target_seconds: float = BCRYPT_TARGET_SECONDS) -> int:
+    """
+    returns the highest cost in BCRYPT_MIN_ROUNDS..BCRYPT_MAX_ROUNDS whose hashpw fits in target_seconds
+    (cached per process, so the benchmark runs once and not on every rerun)
+    """
+    rounds = BCRYPT_MIN_ROUNDS
+    for r in range(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=r))
+        if time.perf_counter() - start > target_seconds:
+            break
+        rounds = r
+    return rounds
+
+# what hash_password() uses; never below the login re-hash target, so its hashes are left alone
+BCRYPT_ROUNDS = max(calibrate_bcrypt_rounds(), BCRYPT_DEFAULT_ROUNDS)
+
+def hash_password(password: str) -> str:
+    """Use this to generate the password hashes stored in st.secrets / users.json"""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+@st.cache_resource(show_spinner=False)
+def _dummy_hash(rounds: int) -> bytes:
+    """
+    a real hash at the given cost, checked against when there is no bcrypt hash to check
+    so every login path costs the same (no username enumeration by response time);
+    cached per process, the script itself re-runs on every interaction
+    """
+    return bcrypt.hashpw(b"dummy-password", bcrypt.gensalt(rounds=rounds))
+
+def _dummy_rounds(users_dict: dict) -> int:
+    # the cost most of the stored hashes use (ties: the higher one), so an unknown user is
+    # as slow to reject as a known user with a wrong password
+    costs = Counter(
+        cost for cost in (_bcrypt_cost(u["password"].decode()) for u in users_dict.values() if u["is_bcrypt"])
+        if cost is not None and 4 <= cost <= 31
+    )
+    if not costs:
+        return BCRYPT_ROUNDS
+    return max(costs, key=lambda c: (costs[c], c))
+
+@st.cache_resource(show_spinner=False)
+def _bcrypt_pool() -> ThreadPoolExecutor:
+    """
+    process-wide pool for bcrypt checks. Sessions already run in their own threads and bcrypt
+    releases the GIL; the pool caps concurrent hashing at the core count, so a burst of logins
+    queues instead of starving the sessions that are running reports
+    """
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="bcrypt")
+
+def _checkpw(password_bytes: bytes, stored: bytes) -> bool:
+    return _bcrypt_pool().submit(bcrypt.checkpw, password_bytes, stored).result()
+
+# successful bcrypt checks are remembered briefly, so a re-login doesn't pay the full cost again
+LOGIN_CACHE_TTL_SECONDS = 15 * 60
+LOGIN_CACHE_MAX_ENTRIES = 512
+
+@st.cache_resource(show_spinner=False)
+def _verified_logins():
+    """
+    process-wide {digest: (username, verified_at)} of successful bcrypt checks, and the lock
+    guarding it: every session thread reads and writes the same dict
+    """
+    return {}, threading.Lock()
+
+def _checkpw_cached(username: str, password_bytes: bytes, stored: bytes) -> bool:
+    # Only successes are cached, so every wrong guess still costs a full bcrypt check. The key
+    # is salted with the stored hash: the cache never holds a password or a bare password hash.
+    key = hashlib.sha256(stored + b"\0" + password_bytes).digest()
+    cache, lock = _verified_logins()
+    now = time.monotonic()
+    with lock:
+        hit = cache.get(key)
+    if hit is not None and now - hit[1] < LOGIN_CACHE_TTL_SECONDS:
+        return True
+    # the bcrypt check itself runs outside the lock
+    ok = _checkpw(password_bytes, stored)
+    if ok:
+        with lock:
+            if len(cache) >= LOGIN_CACHE_MAX_ENTRIES:
+                for k in [k for k, (_, t) in cache.items() if now - t >= LOGIN_CACHE_TTL_SECONDS]:
+                    del cache[k]
+                if len(cache) >= LOGIN_CACHE_MAX_ENTRIES:
+                    del cache[min(cache, key=lambda k: cache[k][1])]
+            cache[key] = (username, now)
+    return ok
+
+def forget_verified_login(username: str):
+    cache, lock = _verified_logins()
+    with lock:
+        for k in [k for k, (user, _) in cache.items() if user == username]:
+            del cache[k]
+
+def _bcrypt_cost(stored: str):
+    # "$2b$12$..." -> 12
+    try:
+        return int(stored[4:6])
+    except ValueError:
+        return None
+
+def _expired(user_record: dict, today: date) -> bool:
+    expiry = user_record.get("expiry")
+    return expiry is not None and expiry < today
+
+def _rehash_if_needed(username: str, password_bytes: bytes, user: dict, users_file):
+    # bring a bcrypt hash to its target cost after a good login. A per-user cost is applied as
+    # given (e.g. 4 for a local test account); otherwise the hash is only ever raised to
+    # BCRYPT_DEFAULT_ROUNDS, never lowered. Users are reloaded from source on every change, so
+    # this only pays off when the new hash can be saved
+    if not users_file:
+        return
+    stored_cost = _bcrypt_cost(user["password"].decode())
+    target = user.get("cost")
+    if target is None:
+        target = BCRYPT_DEFAULT_ROUNDS
+        if stored_cost is not None and stored_cost >= target:
+            return
+    elif stored_cost == target:
+        return
+    new_hash = _bcrypt_pool().submit(bcrypt.hashpw, password_bytes, bcrypt.gensalt(rounds=target)).result()
+    try:
+        save_user_password(users_file, username, new_hash.decode())
+    except (OSError, ValueError) as e:
+        logger.warning("could not persist re-hashed password for %r: %s", username, e)
+        return
+    user["password"] = new_hash
+
+def check_login(username: str, password: str, users_dict: dict, users_file=None):
+    """users_file: users.json path the users came from, so re-hashed passwords can be saved back"""
+    password_bytes = password.encode()
+    dummy_hash = _dummy_hash(_dummy_rounds(users_dict))
     if username not in users_dict:
+        _checkpw(password_bytes, dummy_hash)
         return False, "Invalid username or password"
-    stored = users_dict[username].get("password")
+    user = users_dict[username]
+    stored = user.get("password")
     if not stored:
+        _checkpw(password_bytes, dummy_hash)
         return False, "No password set for this user"
+    # an expired account can't log in whatever the password, so don't spend a bcrypt check on it
+    if _expired(user, date.today()):
+        return False, "Subscription expired"
     try:
-        if isinstance(stored, str) and stored.startswith("$2"):
-            if bcrypt.checkpw(password.encode(), stored.encode()):
-                expiry = users_dict[username].get("expiry")
-                if expiry:
-                    exp_date = datetime.strptime(expiry, "%Y-%m-%d").date()
-                    if exp_date < datetime.today().date():
-                        return False, "Subscription expired"
-                return True, None
-            else:
-                return False, "Invalid username or password"
+        if user["is_bcrypt"]:
+            ok = _checkpw_cached(username, password_bytes, stored)
         else:
-            if password == stored:
-                expiry = users_dict[username].get("expiry")
-                if expiry:
-                    exp_date = datetime.strptime(expiry, "%Y-%m-%d").date()
-                    if exp_date < datetime.today().date():
-                        return False, "Subscription expired"
-                return True, None
-            else:
-                return False, "Invalid username or password"
+            # constant-time: == would stop at the first differing character; the dummy
+            # check keeps legacy plaintext accounts from standing out by response time
+            _checkpw(password_bytes, dummy_hash)
+            ok = hmac.compare_digest(password_bytes, stored)
+        if not ok:
+            return False, "Invalid username or password"
+        if user["is_bcrypt"]:
+            _rehash_if_needed(username, password_bytes, user, users_file)
+        return True, None
     except Exception as e:
         return False, f"Auth error: {e}"
 
-# load users
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_users(source: str, version) -> dict:
+    """
+    normalized users from st.secrets ("secrets") or a users.json path, rebuilt only when version
+    (secrets digest / file mtime) changes rather than on every rerun, so load-time warnings
+    (weak cost, unreadable expiry) are logged once
+    """
+    if source == "secrets":
+        return normalize_users(st.secrets)
+    return load_users_from_file(source)
+
+def _users_file_version(fname):
+    try:
+        return os.stat(fname).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+# load users (st.secrets is read-only, so re-hashed passwords are only persisted for users.json)
 if "users" in st.secrets:
-    users = normalize_users(st.secrets)
+    users_file = None
+    # nested sections are Mappings (not dicts); TOML dates such as expiry = 2026-12-31 go through str
+    secrets_digest = hashlib.sha256(
+        json.dumps(st.secrets["users"], default=lambda o: dict(o) if isinstance(o, Mapping) else str(o),
+                   sort_keys=True).encode()
+    ).hexdigest()
+    users = _load_users("secrets", secrets_digest)
 else:
-    users = load_users_from_file("users.json")
+    users_file = "users.json"
+    users = _load_users(users_file, _users_file_version(users_file))
 
 # -------------------------
 # Ledger parsing & processing (existing logic)
 # -------------------------
+# "Ledger: <party>" rows start each supplier's block; one regex pass instead of strip/lower/startswith
+_LEDGER_HEADER = re.compile(r"\s*ledger:", re.IGNORECASE)
+# ledger rows dated before this are treated as junk (opening balances, mis-parsed cells)
+_MIN_DATE = pd.Timestamp("2000-01-01").to_datetime64()
+# Age (days) <= 45 / <= 60 / <= 90 / > 90, as right-closed pd.cut bins
+AGING_BUCKETS = ["0-45", "46-60", "61-90", ">90"]
+AGING_BUCKET_BINS = [-np.inf, 45, 60, 90, np.inf]
+# 43B(h): MSE invoices must be paid within 45 days of the invoice date
+PAYMENT_DEADLINE = np.timedelta64(45, "D")
+
 def parse_ledger_df(df_raw: pd.DataFrame) -> pd.DataFrame:
-    records = []
-    current_party = None
-    for idx, row in df_raw.iterrows():
-        first_col = str(row[0]) if not pd.isna(row[0]) else ""
-        if isinstance(first_col, str) and first_col.strip().lower().startswith("ledger:"):
-            current_party = str(row[1]).strip() if pd.notna(row[1]) else "Unknown"
-            continue
-        if current_party:
-            date = pd.to_datetime(row[0], errors="coerce", dayfirst=True)
-            if pd.isna(date) or date < pd.Timestamp("2000-01-01"):
-                continue
-            try:
-                debit = float(row[5]) if not pd.isna(row[5]) else 0.0
-                credit = float(row[6]) if not pd.isna(row[6]) else 0.0
-            except Exception:
+    # Work column-wise: "Ledger:" rows carry the party name, which is
+    # forward-filled onto the transaction rows that follow it.
+    # positional access: the sheet is read headerless, so only column order is meaningful
+    first_col = df_raw.iloc[:, 0]
+    mask_hdr = first_col.astype(str).str.match(_LEDGER_HEADER, na=False)
+    name_col = df_raw.iloc[:, 1]
+    party_hdr = name_col.where(name_col.notna(), "Unknown").astype(str).str.strip()
+    party = party_hdr.where(mask_hdr).ffill()
+
+    dates = pd.to_datetime(first_col, errors="coerce", dayfirst=True, format="mixed")
+    debit_col, credit_col = df_raw.iloc[:, 5], df_raw.iloc[:, 6]
+    debit_raw = pd.to_numeric(debit_col, errors="coerce")
+    credit_raw = pd.to_numeric(credit_col, errors="coerce")
+    # a non-blank amount that isn't a number invalidates the row
+    bad_amount = (debit_raw.isna() & debit_col.notna()) | (credit_raw.isna() & credit_col.notna())
+
+    keep = (
+        ~mask_hdr
+        & party.notna()
+        & (party != "")
+        & dates.notna()
+        & (dates >= _MIN_DATE)
+        & ~bad_amount
+    )
+    data = pd.DataFrame({
+        "Party": party[keep].to_numpy(),
+        # ledger dates are calendar days; day resolution keeps the aging maths in plain integers
+        "Date": dates[keep].to_numpy().astype("datetime64[D]"),
+        "Debit": debit_raw[keep].fillna(0.0).astype(float).to_numpy(),
+        "Credit": credit_raw[keep].fillna(0.0).astype(float).to_numpy(),
+    })
+    # Few distinct parties over many rows: integer codes make the sort and later grouping cheap.
+    # Categories are the sorted names, so code order is name order; the stable sort keeps
+    # same-day entries in ledger order.
+    data["Party"] = data["Party"].astype("category")
+    return data.sort_values(by=["Party", "Date"], kind="mergesort", ignore_index=True)
+
+# int64 view of NaT; such rows never take part in matching
+_NAT_DAY = np.iinfo(np.int64).min
+
+@njit(cache=True)
+def _fifo_match(starts, ends, days, debits, credits, cutoff_day):
+    """
+    FIFO-match payments (debits) against bills (credits) dated on or before cutoff_day, for
+    the whole ledger in one call. Rows are grouped by party, party p owning rows starts[p]:ends[p];
+    days are int64 day numbers. Each party's two deques are emulated with head/tail indices
+    into its own row range of ledger-sized scratch arrays (a party never queues more entries
+    than it has rows); what is left queued is then compacted to the front, which never
+    overtakes a later party's range.
+    returns (bill_party, bill_days, bill_amounts, bill_matched, adv_party, adv_amounts): the bills
+    and advances still open at the cutoff, in party order, tagged with their party number
+    """
+    n = len(days)
+    bill_party = np.empty(n, np.int64)
+    bill_days = np.empty(n, np.int64)
+    bill_amounts = np.empty(n, np.float64)
+    bill_matched = np.empty(n, np.float64)
+    adv_party = np.empty(n, np.int64)
+    adv_amounts = np.empty(n, np.float64)
+    n_bills = n_advs = 0
+
+    for p in range(len(starts)):
+        b_head = b_tail = starts[p]
+        a_head = a_tail = starts[p]
+        for i in range(starts[p], ends[p]):
+            if days[i] == _NAT_DAY or days[i] > cutoff_day:
                 continue
-            records.append([current_party, date, debit, credit])
-    data = pd.DataFrame(records, columns=["Party", "Date", "Debit", "Credit"])
-    data = data.sort_values(by=["Party", "Date"]).reset_index(drop=True)
-    return data
-
-def calculate_creditor_aging_and_43b(df: pd.DataFrame, cutoff_date: pd.Timestamp, msme_map: pd.DataFrame):
+            if debits[i] > 0:
+                amt = debits[i]
+                while amt > 0 and b_head < b_tail:
+                    to_match = min(bill_amounts[b_head] - bill_matched[b_head], amt)
+                    bill_matched[b_head] += to_match
+                    amt -= to_match
+                    if bill_matched[b_head] == bill_amounts[b_head]:
+                        b_head += 1
+                if amt > 0:
+                    adv_amounts[a_tail] = amt
+                    a_tail += 1
+            elif credits[i] > 0:
+                bill_amt = credits[i]
+                while bill_amt > 0 and a_head < a_tail:
+                    to_match = min(bill_amt, adv_amounts[a_head])
+                    bill_amt -= to_match
+                    adv_amounts[a_head] -= to_match
+                    if adv_amounts[a_head] <= 0:
+                        a_head += 1
+                if bill_amt > 0:
+                    bill_days[b_tail] = days[i]
+                    bill_amounts[b_tail] = bill_amt
+                    bill_matched[b_tail] = 0.0
+                    b_tail += 1
+        for k in range(b_head, b_tail):
+            bill_party[n_bills] = p
+            bill_days[n_bills] = bill_days[k]
+            bill_amounts[n_bills] = bill_amounts[k]
+            bill_matched[n_bills] = bill_matched[k]
+            n_bills += 1
+        for k in range(a_head, a_tail):
+            adv_party[n_advs] = p
+            adv_amounts[n_advs] = adv_amounts[k]
+            n_advs += 1
+
+    return (bill_party[:n_bills], bill_days[:n_bills], bill_amounts[:n_bills], bill_matched[:n_bills],
+            adv_party[:n_advs], adv_amounts[:n_advs])
+
+@njit(cache=True)
+def _allocate_after_cutoff(bill_party, bill_unpaid, pay_party, pay_days, pay_amounts):
+    """
+    FIFO-allocate post-cutoff payments over the bills still open at the cutoff, for the whole
+    ledger: a two-pointer walk, both sides being in (party, date) order.
+    returns (remaining, paid, paid_day) per bill; paid_day is _NAT_DAY where nothing was paid
+    """
+    n_bills = len(bill_party)
+    n_pays = len(pay_party)
+    remaining = bill_unpaid.copy()
+    paid = np.zeros(n_bills, np.float64)
+    paid_day = np.full(n_bills, _NAT_DAY, np.int64)
+    pay_left = pay_amounts.copy()
+    j = 0
+    for i in range(n_bills):
+        p = bill_party[i]
+        # payments of parties with no bills left to pay are never used
+        while j < n_pays and pay_party[j] < p:
+            j += 1
+        while remaining[i] > 0 and j < n_pays and pay_party[j] == p:
+            alloc = min(remaining[i], pay_left[j])
+            remaining[i] -= alloc
+            paid[i] += alloc
+            paid_day[i] = pay_days[j]
+            pay_left[j] -= alloc
+            if pay_left[j] <= 0:
+                j += 1
+    return remaining, paid, paid_day
+
+def _frame_digest(df: pd.DataFrame):
+    # Full-content hash; Streamlit's default DataFrame hasher samples large frames
+    return tuple(map(str, df.columns)), pd.util.hash_pandas_object(df, index=True).values.tobytes()
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _frame_digest})
+def build_exempt_map(msme_map: pd.DataFrame) -> dict:
     """
     msme_map: DataFrame with columns:
       'Supplier Name','Registered (Yes/No)','Category (Micro/Small/Medium)','Business Type (Trader/Manufacturer/Service Provider)'
+    returns {lowercased supplier name: (exempt, reason)}, resolved once per supplier (first row wins on duplicates):
+     - If Registered == 'No' => exempt (reason: Non-registered)
+     - If Category == 'Medium' => exempt (reason: Medium category)
+     - If Business Type == 'Trader' => exempt (reason: Trader)
+    A party not in the map is unknown -> not exempt by MSME (user can edit)
     """
-    # Normalize msme_map for quick lookup
     if msme_map is None or msme_map.empty:
-        msme_map = pd.DataFrame(columns=['Supplier Name','Registered (Yes/No)','Category','Business Type'])
+        return {}
     msme_map = msme_map.rename(columns={
         'Registered (Yes/No)': 'Registered',
         'Category (Micro/Small/Medium)': 'Category',
         'Business Type (Trader/Manufacturer/Service Provider)': 'Business Type'
     }, errors='ignore')
-    msme_map['Supplier Name'] = msme_map['Supplier Name'].astype(str).str.strip()
-
-    def is_exempt(party_name):
-        """
-        Exemption rules (return (bool, reason_str)):
-         - If Registered == 'No' => exempt (reason: Non-registered)
-         - If Category == 'Medium' => exempt (reason: Medium category)
-         - If Business Type == 'Trader' => exempt (reason: Trader)
-        If party not found in msme_map, treat as unknown -> not exempt by MSME (user can edit)
-        """
-        row = msme_map[msme_map['Supplier Name'].str.lower() == str(party_name).strip().lower()]
-        if row.empty:
-            return False, ""  # unknown -> not exempt by MSME rules
-        r = row.iloc[0]
-        reg = str(r.get('Registered', '')).strip().lower()
-        cat = str(r.get('Category', '')).strip().lower()
-        btype = str(r.get('Business Type', '')).strip().lower()
-        if reg in ('no', 'n', 'false', '0', ''):
-            return True, "Exempt: Non-MSME registered"
-        if cat == 'medium':
-            return True, "Exempt: Medium category"
-        if 'trader' in btype:
-            return True, "Exempt: Trader"
-        return False, ""
-
-    aging_summary = []
-    log_details = []
-    disallow_43b = []
-
-    for party, group in df.groupby("Party"):
-        group = group.sort_values("Date").reset_index(drop=True)
-
-        unmatched_bills = deque()
-        unmatched_advances = deque()
-
-        # Build unmatched invoices and advances using transactions <= cutoff
-        for _, row in group.iterrows():
-            txn_date = row["Date"]
-            if pd.isna(txn_date):
-                continue
-
-            if row["Debit"] > 0 and txn_date <= cutoff_date:
-                amt = row["Debit"]
-                while amt > 0 and unmatched_bills:
-                    bill = unmatched_bills[0]
-                    avail = bill["amount"] - bill["matched"]
-                    to_match = min(avail, amt)
-                    bill["matched"] += to_match
-                    amt -= to_match
-                    if bill["matched"] == bill["amount"]:
-                        unmatched_bills.popleft()
-                if amt > 0:
-                    unmatched_advances.append({"date": txn_date, "amount": amt})
-
-            elif row["Credit"] > 0 and txn_date <= cutoff_date:
-                bill_amt = row["Credit"]
-                while bill_amt > 0 and unmatched_advances:
-                    adv = unmatched_advances[0]
-                    to_match = min(bill_amt, adv["amount"])
-                    bill_amt -= to_match
-                    adv["amount"] -= to_match
-                    if adv["amount"] <= 0:
-                        unmatched_advances.popleft()
-                if bill_amt > 0:
-                    unmatched_bills.append({"date": txn_date, "amount": bill_amt, "matched": 0})
-
-        advance_amount = sum(a["amount"] for a in unmatched_advances)
-
-        buckets = {"0-45": 0.0, "46-60": 0.0, "61-90": 0.0, ">90": 0.0}
-        pending_invoices = []
-
-        for bill in unmatched_bills:
-            unpaid = bill["amount"] - bill["matched"]
-            if unpaid <= 0:
-                continue
-            age = (cutoff_date - bill["date"]).days
-            if age <= 45:
-                bucket = "0-45"
-            elif age <= 60:
-                bucket = "46-60"
-            elif age <= 90:
-                bucket = "61-90"
-            else:
-                bucket = ">90"
-            buckets[bucket] += unpaid
-
-            log_details.append({
-                "Party": party,
-                "Invoice Date": bill["date"],
-                "Invoice Amount": bill["amount"],
-                "Matched Amount": bill["matched"],
-                "Unpaid Amount": unpaid,
-                "Age (in days)": age,
-                "Aging Bucket": bucket,
-                "Remarks": ""
-            })
-
-            pending_invoices.append({
-                "date": bill["date"],
-                "amount": bill["amount"],
-                "remaining": unpaid
-            })
-
-        payments_after_cutoff = []
-        for _, r in group.iterrows():
-            if r["Debit"] > 0 and r["Date"] > cutoff_date:
-                payments_after_cutoff.append({"date": r["Date"], "amount_remaining": r["Debit"]})
-        payments_after_cutoff.sort(key=lambda x: x["date"])
-
-        for inv in pending_invoices:
-            inv["paid_amount_after_cutoff"] = 0.0
-            inv["paid_date_after_cutoff"] = None
-
-        for pay in payments_after_cutoff:
-            if pay["amount_remaining"] <= 0:
-                continue
-            for inv in pending_invoices:
-                if pay["amount_remaining"] <= 0:
-                    break
-                if inv["remaining"] <= 0:
-                    continue
-                alloc = min(inv["remaining"], pay["amount_remaining"])
-                inv["remaining"] -= alloc
-                inv["paid_amount_after_cutoff"] += alloc
-                inv["paid_date_after_cutoff"] = pay["date"]
-                pay["amount_remaining"] -= alloc
-
-        # Build 43B disallowance rows (but incorporate MSME exemptions)
-        for inv in pending_invoices:
-            unpaid_after = inv["remaining"]
-            paid_amt_after = inv.get("paid_amount_after_cutoff", 0.0)
-            paid_date_after = inv.get("paid_date_after_cutoff", None)
-            deadline = inv["date"] + pd.Timedelta(days=45)
-
-            if paid_amt_after >= (inv.get("amount", 0.0)):
-                within_45_days = "Yes" if (paid_date_after is not None and paid_date_after <= deadline) else "No"
-            else:
-                within_45_days = "No"
-
-            # MSME exemption check
-            exempt, reason = is_exempt(party)
-            if exempt:
-                disallowed_flag = "No"
-                within_45_days = "Exempt"
-                paid_amt_report = min(paid_amt_after, inv.get("amount", 0.0))
-            else:
-                disallowed_flag = "No" if within_45_days == "Yes" else "Yes"
-                paid_amt_report = min(paid_amt_after, inv.get("amount", 0.0))
-
-            disallow_43b.append({
-                "Party": party,
-                "Invoice Date": inv["date"],
-                "Invoice Amount": inv.get("amount", 0.0),
-                "Unpaid Amount (after cutoff allocations)": unpaid_after,
-                "Paid Amount (after cutoff)": paid_amt_report,
-                "Paid Date (after cutoff)": paid_date_after,
-                "Within 45 Days": within_45_days,
-                "Disallowed u/s 43B(h)": disallowed_flag,
-                "MSME Exemption Applied": "Yes" if exempt else "No",
-                "Exemption Reason": reason
-            })
-
-        party_summary = {
-            "Party": party,
-            "Total Outstanding": sum(buckets.values()),
-            **buckets,
-            "Advance to Supplier": advance_amount
-        }
-        aging_summary.append(party_summary)
-
-    return pd.DataFrame(aging_summary), pd.DataFrame(log_details), pd.DataFrame(disallow_43b)
+    keys = msme_map['Supplier Name'].astype(str).str.strip().str.lower()
+    rules_df = msme_map.reindex(columns=['Registered', 'Category', 'Business Type'], fill_value='')
+    reg, cat, btype = (rules_df[c].astype(str).str.strip().str.lower() for c in rules_df.columns)
+
+    # rules in priority order; np.select picks the reason of the first that holds
+    conditions = [
+        reg.isin(['no', 'n', 'false', '0', '']).to_numpy(),
+        cat.eq('medium').fillna(False).to_numpy(bool),
+        btype.str.contains('trader', regex=False, na=False).to_numpy(bool),
+    ]
+    exempt = np.logical_or.reduce(conditions)
+    reasons = np.select(conditions, ["Exempt: Non-MSME registered", "Exempt: Medium category", "Exempt: Trader"], "")
+    first = ~keys.duplicated().to_numpy()
+    return dict(zip(keys[first], zip(exempt[first].tolist(), reasons[first].tolist())))
+
+def calculate_creditor_aging_and_43b(df: pd.DataFrame, cutoff_date: pd.Timestamp, exempt_map: dict):
+    """
+    exempt_map: {lowercased supplier name: (exempt, reason)} as returned by build_exempt_map
+    """
+    cutoff_np = np.datetime64(cutoff_date, "D")
+
+    # Split into per-party slices with NumPy rather than iterating a groupby: order the
+    # rows by (party, date) and cut where the party code changes. lexsort is stable, so
+    # same-day entries keep their ledger order.
+    codes, parties = pd.factorize(df["Party"], sort=True)
+    dates = df["Date"].to_numpy().astype("datetime64[D]")
+    order = np.lexsort((dates, codes))
+    order = order[codes[order] >= 0]  # rows without a party are dropped, as groupby did
+    codes = codes[order]
+    dates = dates[order]
+    debits = df["Debit"].to_numpy(dtype=np.float64)[order]
+    credits = df["Credit"].to_numpy(dtype=np.float64)[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], bounds)) if len(codes) else np.empty(0, dtype=int)
+    ends = np.concatenate((bounds, [len(codes)])) if len(codes) else np.empty(0, dtype=int)
+
+    # Unmatched invoices and advances using transactions <= cutoff: one compiled pass over the ledger
+    cutoff_day = cutoff_np.astype(np.int64)
+    bill_party, bill_days, bill_amounts, bill_matched, adv_party, adv_amounts = _fifo_match(
+        starts, ends, dates.view(np.int64), debits, credits, cutoff_day
+    )
+    unpaid = bill_amounts - bill_matched
+    is_open = unpaid > 0
+    bill_party, bill_days, bill_amounts, bill_matched, unpaid = (
+        bill_party[is_open], bill_days[is_open], bill_amounts[is_open], bill_matched[is_open], unpaid[is_open]
+    )
+    bill_dates = bill_days.view("datetime64[D]")
+
+    # FIFO log and aging summary come straight off the flat open-bill arrays
+    n_parties = len(starts)
+    party_names = np.asarray(parties, dtype=object)
+    ages = cutoff_day - bill_days
+    buckets = pd.cut(ages, bins=AGING_BUCKET_BINS, labels=AGING_BUCKETS)
+    bucket_idx = buckets.codes.astype(np.int64)
+    n_buckets = len(AGING_BUCKETS)
+    bucket_totals = np.bincount(bill_party * n_buckets + bucket_idx, weights=unpaid,
+                                minlength=n_parties * n_buckets).reshape(n_parties, n_buckets)
+    aging_df = pd.DataFrame({
+        "Party": party_names,
+        "Total Outstanding": bucket_totals.sum(axis=1),
+        **{bucket: bucket_totals[:, k] for k, bucket in enumerate(AGING_BUCKETS)},
+        "Advance to Supplier": np.bincount(adv_party, weights=adv_amounts, minlength=n_parties),
+    })
+    log_df = pd.DataFrame({
+        "Party": party_names[bill_party],
+        "Invoice Date": bill_dates,
+        "Invoice Amount": bill_amounts,
+        "Matched Amount": bill_matched,
+        "Unpaid Amount": unpaid,
+        "Age (in days)": ages,
+        "Aging Bucket": buckets,
+        "Remarks": ""
+    })
+
+    # MSME exemption, once per party: exempt invoices are never disallowed, so their
+    # post-cutoff payments are left out of the allocation
+    exemptions = [exempt_map.get(str(name).strip().lower(), (False, "")) for name in party_names]
+    party_exempt = np.array([exempt for exempt, _ in exemptions], dtype=bool)
+    party_reason = np.array([reason for _, reason in exemptions], dtype=object)
+
+    # post-cutoff payments are already in (party, date) order, i.e. FIFO within each party
+    pay_rows = np.flatnonzero((debits > 0) & (dates > cutoff_np) & ~party_exempt[codes])
+    remaining, paid, paid_days = _allocate_after_cutoff(
+        bill_party, unpaid, codes[pay_rows].astype(np.int64), dates[pay_rows].view(np.int64), debits[pay_rows]
+    )
+    paid_dates = paid_days.view("datetime64[D]")
+
+    # 43B(h) columns, like the FIFO log, straight off the flat open-bill arrays
+    bill_exempt = party_exempt[bill_party]
+    # paid in full, by the last payment's date no later than invoice date + 45 days
+    # (NaT, i.e. nothing paid, never compares as on time)
+    on_time = (paid >= bill_amounts) & (paid_dates <= bill_dates + PAYMENT_DEADLINE)
+    df_43b = pd.DataFrame({
+        "Party": party_names[bill_party],
+        "Invoice Date": bill_dates,
+        "Invoice Amount": bill_amounts,
+        "Unpaid Amount (after cutoff allocations)": remaining,
+        "Paid Amount (after cutoff)": np.minimum(paid, bill_amounts),
+        "Paid Date (after cutoff)": np.where(paid > 0, paid_dates, np.datetime64("NaT")),
+        "Within 45 Days": np.where(bill_exempt, "Exempt", np.where(on_time, "Yes", "No")).astype(object),
+        "Disallowed u/s 43B(h)": np.where(bill_exempt | on_time, "No", "Yes").astype(object),
+        "MSME Exemption Applied": np.where(bill_exempt, "Yes", "No").astype(object),
+        "Exemption Reason": party_reason[bill_party],
+    })
+    return aging_df, log_df, df_43b
 
 # -------------------------
 # MSME template helpers
 # -------------------------
-def make_msme_template(parties_list):
-    # If parties_list provided, prefill Supplier Name col
-    rows = []
-    for p in parties_list:
-        rows.append({
-            "Supplier Name": p,
-            "Registered (Yes/No)": "",
-            "Category (Micro/Small/Medium)": "",
-            "Business Type (Trader/Manufacturer/Service Provider)": ""
-        })
-    df = pd.DataFrame(rows)
-    return df
+@st.cache_data(show_spinner=False)
+def make_msme_template(parties_tuple):
+    # If parties_tuple provided, prefill Supplier Name col (tuple so it can be a cache key)
+    n = len(parties_tuple)
+    return pd.DataFrame({
+        "Supplier Name": list(parties_tuple),
+        "Registered (Yes/No)": [""] * n,
+        "Category (Micro/Small/Medium)": [""] * n,
+        "Business Type (Trader/Manufacturer/Service Provider)": [""] * n
+    })
+
+def msme_key_index(msme_df: pd.DataFrame) -> pd.Index:
+    """
+    unique stripped/lowercased supplier names of the mapping; Index.get_indexer on it
+    resolves a whole batch of parties in one vectorized call (-1 = not in the mapping)
+    """
+    return pd.Index(msme_df['Supplier Name'].astype(str).str.strip().str.lower()).unique()
+
+def msme_names_digest(msme_df: pd.DataFrame) -> bytes:
+    # content hash of the supplier names only; edits to the status columns leave it unchanged
+    return pd.util.hash_pandas_object(msme_df['Supplier Name'], index=False).values.tobytes()
+
+def refresh_msme_keys(state):
+    """rebuild state.msme_key_index only when the supplier names changed (state: st.session_state)"""
+    digest = msme_names_digest(state.msme_df)
+    if state.get("msme_names_digest") != digest:
+        state.msme_key_index = msme_key_index(state.msme_df)
+        state.msme_names_digest = digest
+
+EXCEL_WRITE_CHUNK_ROWS = 10_000
+# above this many rows in total, to_excel_bytes_fast hands over to the streaming writer
+FAST_EXCEL_MAX_ROWS = 50_000
+
+def _to_excel_bytes_openpyxl(df_dict, out):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    for name, df in df_dict.items():
+        ws = wb.create_sheet(name)
+        header = []
+        for c in df.columns:
+            cell = WriteOnlyCell(ws, value=str(c))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(out)
+    return out.getvalue()
 
 def to_excel_bytes(df_dict):
     """
     df_dict: {sheetname: dataframe}
     returns bytes of xlsx
+    xlsxwriter runs in constant_memory mode, flushing each row as it is written
+    (pandas' to_excel writes column by column, which that mode can't take, so rows are written here);
+    without xlsxwriter, openpyxl's append-only write_only workbook keeps memory similarly flat
+    """
+    out = BytesIO()
+    if xlsxwriter is None:
+        return _to_excel_bytes_openpyxl(df_dict, out)
+    # strings_to_urls off: party names / remarks are plain text, and skipping the URL regex on every cell is cheaper
+    wb = xlsxwriter.Workbook(out, {
+        "constant_memory": True,
+        "strings_to_urls": False,
+        "default_date_format": "yyyy-mm-dd",
+    })
+    header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center"})
+    for name, df in df_dict.items():
+        ws = wb.add_worksheet(name)
+        ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+        # convert to Python values a block at a time, so no whole-sheet object copy is held
+        r = 1
+        for lo in range(0, len(df), EXCEL_WRITE_CHUNK_ROWS):
+            chunk = df.iloc[lo:lo + EXCEL_WRITE_CHUNK_ROWS]
+            for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+                ws.write_row(r, 0, row)
+                r += 1
+    wb.close()
+    return out.getvalue()
+
+def to_excel_bytes_fast(df_dict):
     """
+    df_dict: {sheetname: dataframe}
+    returns bytes of xlsx, written as one bulk range per sheet with pyexcelerate when installed.
+    That copies every sheet into Python lists first, so larger reports (and setups without
+    pyexcelerate) go through the streaming to_excel_bytes instead
+    """
+    if FastWorkbook is None or sum(len(df) for df in df_dict.values()) > FAST_EXCEL_MAX_ROWS:
+        return to_excel_bytes(df_dict)
+    wb = FastWorkbook()
+    for name, df in df_dict.items():
+        values = df.astype(object).where(df.notna(), None)
+        ws = wb.new_sheet(name, data=[[str(c) for c in df.columns]] + values.values.tolist())
+        # datetimes are stored as serial numbers; give those columns a date format
+        for i, dtype in enumerate(df.dtypes, start=1):
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                ws.set_col_style(i, Style(format=Format("yyyy-mm-dd")))
     out = BytesIO()
-    with pd.ExcelWriter(out, engine="openpyxl") as writer:
-        for name, df in df_dict.items():
-            df.to_excel(writer, sheet_name=name, index=False)
-    out.seek(0)
+    wb.save(out)
     return out.getvalue()
 
+@st.cache_data(show_spinner=False)
+def template_bytes(parties_tuple):
+    """
+    returns (csv_bytes, xlsx_bytes) of the MSME template; only rebuilt when the parties change
+    """
+    sample_df = make_msme_template(parties_tuple)
+    return sample_df.to_csv(index=False).encode('utf-8'), to_excel_bytes_fast({"MSME Template": sample_df})
+
+# -------------------------
+# Cached loaders (keyed on uploaded bytes / frame contents, so reruns are free;
+# the ledger-sized ones keep only a few entries so a long session doesn't pile them up)
+# -------------------------
+def _read_excel(bytes_blob: bytes, **kwargs) -> pd.DataFrame:
+    # calamine (Rust) is much faster than openpyxl; fall back if it isn't installed or can't
+    # handle the file (pandas raises ValueError for an engine it doesn't know)
+    try:
+        return pd.read_excel(BytesIO(bytes_blob), engine="calamine", **kwargs)
+    except (ImportError, ValueError):
+        return pd.read_excel(BytesIO(bytes_blob), engine="openpyxl", **kwargs)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_ledger(bytes_blob: bytes) -> pd.DataFrame:
+    return parse_ledger_df(_read_excel(bytes_blob, header=None))
+
+@st.cache_data(show_spinner=False)
+def _load_msme(bytes_blob: bytes, is_csv: bool) -> pd.DataFrame:
+    if is_csv:
+        return pd.read_csv(BytesIO(bytes_blob))
+    return _read_excel(bytes_blob)
+
+@st.cache_data(show_spinner=False, max_entries=4, hash_funcs={pd.DataFrame: _frame_digest})
+def _run_aging(df: pd.DataFrame, cutoff_date: pd.Timestamp, exempt_map: dict):
+    return calculate_creditor_aging_and_43b(df, cutoff_date, exempt_map)
+
+@st.cache_data(show_spinner=False, max_entries=4, hash_funcs={pd.DataFrame: _frame_digest})
+def _mapping_bytes(msme_df: pd.DataFrame) -> bytes:
+    # the edited mapping is re-offered for download on every rerun; only re-serialize when it changes
+    return to_excel_bytes({"MSME Mapping": msme_df})
+
 # -------------------------
 # UI & Session state
 # -------------------------
@@ -317,7 +752,7 @@ if not st.session_state.logged_in:
         password = st.text_input("Password", type="password")
     with col2:
         if st.button("Login"):
-            ok, msg = check_login(username.strip(), password, users)
+            ok, msg = check_login(username.strip(), password, users, users_file)
             if ok:
                 st.session_state.logged_in = True
                 st.session_state.user = username.strip()
@@ -331,6 +766,7 @@ else:
     st.sidebar.write(f"Logged in as: **{st.session_state.user}**")
     # Sidebar logout button
     if st.sidebar.button("Logout"):
+        forget_verified_login(st.session_state.user)
         st.session_state.logged_in = False
         st.rerun()
 
@@ -338,7 +774,8 @@ else:
 
     # Main area refresh/reset button - put this just before Step 1 header
     if st.button("🔄 Refresh/Reset"):
-        for k in ["msme_df", "parsed_data", "unique_parties"]:
+        for k in ["msme_df", "msme_key_index", "msme_names_digest", "missing_checked_for",
+                  "parsed_data", "ledger_hash", "unique_parties"]:
             if k in st.session_state:
                 del st.session_state[k]
         st.rerun()
@@ -361,12 +798,19 @@ else:
     unique_parties = []
     if uploaded_file is not None:
         try:
-            df_raw = pd.read_excel(uploaded_file, header=None)
-            parsed_data = parse_ledger_df(df_raw)
+            raw = uploaded_file.getvalue()
+            # st.cache_data hands back a fresh unpickled copy on every hit; keeping the frame in
+            # session_state under the upload's digest skips that on reruns with the same file
+            digest = hashlib.sha256(raw).digest()
+            if st.session_state.get("ledger_hash") != digest or "parsed_data" not in st.session_state:
+                st.session_state.parsed_data = _load_ledger(raw)
+                st.session_state.ledger_hash = digest
+            parsed_data = st.session_state.parsed_data
             st.success("Ledger parsed successfully.")
             st.subheader("Preview (first 2 rows)")
             st.dataframe(parsed_data.head(2))
-            unique_parties = parsed_data['Party'].drop_duplicates().sort_values().tolist()
+            # Party is categorical with exactly the observed names, already sorted: no per-rerun dedupe/sort
+            unique_parties = parsed_data['Party'].cat.categories.tolist()
             st.info(f"Found {len(unique_parties)} unique suppliers/parties.")
         except Exception as e:
             st.error(f"Error reading/processing ledger: {e}")
@@ -378,9 +822,7 @@ else:
     col_a, col_b = st.columns([1,1])
     with col_a:
         st.markdown("**Download sample template**")
-        sample_df = make_msme_template(unique_parties[:50])  # limit preview to first 50 for template
-        csv_bytes = sample_df.to_csv(index=False).encode('utf-8')
-        excel_bytes = to_excel_bytes({"MSME Template": sample_df})
+        csv_bytes, excel_bytes = template_bytes(tuple(unique_parties[:50]))  # limit preview to first 50 for template
         st.download_button("Download template (CSV)", data=csv_bytes, file_name="msme_template.csv", mime="text/csv")
         st.download_button("Download template (Excel)", data=excel_bytes, file_name="msme_template.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     with col_b:
@@ -389,13 +831,11 @@ else:
     # Load or initialize msme_df in session
     if "msme_df" not in st.session_state:
         st.session_state.msme_df = pd.DataFrame(columns=['Supplier Name','Registered (Yes/No)','Category (Micro/Small/Medium)','Business Type (Trader/Manufacturer/Service Provider)'])
+        refresh_msme_keys(st.session_state)
 
     if uploaded_msme is not None:
         try:
-            if uploaded_msme.name.endswith('.csv'):
-                msme_df = pd.read_csv(uploaded_msme)
-            else:
-                msme_df = pd.read_excel(uploaded_msme)
+            msme_df = _load_msme(uploaded_msme.getvalue(), uploaded_msme.name.endswith('.csv'))
             # Ensure required columns
             required_cols = ['Supplier Name','Registered (Yes/No)','Category (Micro/Small/Medium)','Business Type (Trader/Manufacturer/Service Provider)']
             missing = [c for c in required_cols if c not in msme_df.columns]
@@ -404,29 +844,28 @@ else:
             else:
                 # normalize supplier names
                 msme_df['Supplier Name'] = msme_df['Supplier Name'].astype(str).str.strip()
-                st.session_state.msme_df = msme_df.copy()
+                st.session_state.msme_df = msme_df
+                refresh_msme_keys(st.session_state)
                 st.success("MSME mapping loaded.")
         except Exception as e:
             st.error(f"Error reading MSME mapping: {e}")
 
     # If parsed ledger exists, ensure all parties are present in msme_df (add missing rows)
+    # Only re-checked when the ledger or the supplier names changed since the last check
     if parsed_data is not None:
-        current_msme = st.session_state.msme_df.copy()
-        parties_in_map = current_msme['Supplier Name'].astype(str).str.strip().str.lower().tolist()
-        added = 0
-        for p in unique_parties:
-            if str(p).strip().lower() not in parties_in_map:
-                # append blank row
-                current_msme = pd.concat([current_msme, pd.DataFrame([{
-                    'Supplier Name': p,
-                    'Registered (Yes/No)': '',
-                    'Category (Micro/Small/Medium)': '',
-                    'Business Type (Trader/Manufacturer/Service Provider)': ''
-                }])], ignore_index=True)
-                added += 1
-        if added > 0:
-            st.session_state.msme_df = current_msme
-            st.info(f"Added {added} suppliers to MSME mapping for editing.")
+        checked_for = (st.session_state.ledger_hash, st.session_state.msme_names_digest)
+        if st.session_state.get("missing_checked_for") != checked_for:
+            party_keys = pd.Index(unique_parties, dtype=object).astype(str).str.strip().str.lower()
+            is_missing = st.session_state.msme_key_index.get_indexer(party_keys) == -1
+            # collect blank rows for every missing party and append them in one concat
+            missing = [p for p, miss in zip(unique_parties, is_missing) if miss]
+            added = len(missing)
+            if added > 0:
+                st.session_state.msme_df = pd.concat([st.session_state.msme_df, make_msme_template(tuple(missing))],
+                                                     ignore_index=True)
+                refresh_msme_keys(st.session_state)
+                st.info(f"Added {added} suppliers to MSME mapping for editing.")
+            st.session_state.missing_checked_for = (st.session_state.ledger_hash, st.session_state.msme_names_digest)
 
     # Inline edit using data_editor (available in newer Streamlit)
     st.markdown("**Edit MSME mapping (inline)** — Edit here.")
@@ -434,12 +873,13 @@ else:
     st.markdown("If you don't know the MSME status of the supplier and want to check ,**as if they would fall under eligible category** ,select and delete them from the below list, it will be treated as registered MSME.")
 
     edited = st.data_editor(st.session_state.msme_df, num_rows="dynamic", use_container_width=True)
-    # Save edited back to session
-    st.session_state.msme_df = edited.copy()
+    # Save edited back to session (data_editor returns a new frame each run, so no copy needed)
+    st.session_state.msme_df = edited
+    refresh_msme_keys(st.session_state)
 
     # Allow user to export the MSME mapping they edited
     if not st.session_state.msme_df.empty:
-        out_msme_bytes = to_excel_bytes({"MSME Mapping": st.session_state.msme_df})
+        out_msme_bytes = _mapping_bytes(st.session_state.msme_df)
         st.download_button(
             "⬇ Download MSME mapping you edited (Excel)",
             data=out_msme_bytes,
@@ -457,9 +897,11 @@ else:
         with run_col:
             if st.button("Run & Download Final Report (Excel)"):
                 with st.spinner("Processing..."):
-                    msme_map = st.session_state.msme_df.copy()
-                    aging_df, log_df, df_43b_log = calculate_creditor_aging_and_43b(parsed_data, pd.to_datetime(cutoff_date), msme_map)
-                    out_bytes = to_excel_bytes({
+                    msme_map = st.session_state.msme_df
+                    exempt_map = build_exempt_map(msme_map)
+                    cutoff_ts = pd.Timestamp(cutoff_date)
+                    aging_df, log_df, df_43b_log = _run_aging(parsed_data, cutoff_ts, exempt_map)
+                    out_bytes = to_excel_bytes_fast({
                         "Aging Summary": aging_df,
                         "FIFO Log": log_df,
                         "43B Disallowance": df_43b_log,